@@ -1,16 +1,22 @@
 import os
+import sys
 
-from flask import Flask, flash, g, jsonify, redirect, render_template, request, session, url_for
+import click
+from flask import Flask, Response, flash, g, jsonify, redirect, render_template, request, session, stream_with_context, url_for
 from flask_debugtoolbar import DebugToolbarExtension
 from flask_wtf.csrf import validate_csrf
 from wtforms import ValidationError
 from sqlalchemy.exc import IntegrityError
 
 from config import DATABASE_URI_FALLBACK, SECRET_KEY_FALLBACK
-from constants import CURRENT_USER_KEY
+from constants import CURRENT_USER_KEY, COMPARISON_RETENTION_MONTHS, COMPARISON_PARTITIONS_AHEAD, BULK_BATCH_SIZE
 from forms import SignupForm, LoginForm, ComparisonForm
-from func_and_dec import login_required, perform_login, perform_logout, get_asset_info, commit_asset_to_db, compare_assets_mc, commit_asset_comparison_to_db
+from func_and_dec import login_required, perform_login, perform_logout, get_asset_info, add_asset_to_db, compare_assets_mc, commit_asset_comparison_to_db, serialize_comparison, stream_user_history, history_to_csv, history_to_ndjson
 from models import User, UserAssetComparison, connect_db, db
+from quotes import AssetLookupError, ApiUnavailableError
+from fx import UnsupportedCurrencyError, FxRatesUnavailableError, validate_currency, usd_rate, convert_quotes, convert_history, refresh_fx_rates
+from retention import apply_retention
+from bulk import CsvSink, DatabaseSink, read_pairs, load_checkpoint, run_bulk_comparison
 
 app = Flask(__name__)
 
@@ -22,6 +28,10 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = True
 app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 
+# Get the comparison retention settings from environ variables or use the default values.
+app.config['COMPARISON_RETENTION_MONTHS'] = int(os.environ.get('COMPARISON_RETENTION_MONTHS', COMPARISON_RETENTION_MONTHS))
+app.config['COMPARISON_PARTITIONS_AHEAD'] = int(os.environ.get('COMPARISON_PARTITIONS_AHEAD', COMPARISON_PARTITIONS_AHEAD))
+
 debug = DebugToolbarExtension(app)
 
 # after configuration, connect the db/app
@@ -41,6 +51,85 @@ def determine_g():
     else:
         g.user = User.query.get(user_id)
 
+# CLI commands
+@app.cli.command('apply-retention')
+def apply_retention_command():
+    """
+    Creates upcoming monthly partitions of users_assets_comparisons.
+    Rolls comparisons older than COMPARISON_RETENTION_MONTHS into daily aggregates and drops their partitions.
+    Meant to be run on a schedule, e.g. daily from cron with `flask apply-retention`.
+    """
+
+    dropped = apply_retention(app.config['COMPARISON_RETENTION_MONTHS'], app.config['COMPARISON_PARTITIONS_AHEAD'])
+
+    click.echo(f"Dropped {len(dropped)} expired partition(s): {', '.join(dropped) or 'none'}")
+
+@app.cli.command('refresh-fx-rates')
+def refresh_fx_rates_command():
+    """
+    Refreshes every FX rate in the fx_rates table from the CoinMarketCap API.
+    Rates are also refreshed on demand once they are older than FX_RATES_TTL_SECONDS.
+    """
+
+    matrix = refresh_fx_rates()
+
+    click.echo(f"Refreshed FX rates for {', '.join(matrix.currencies)}")
+
+@app.cli.command('bulk-compare')
+@click.argument('pairs_file', type=click.File('r'), default='-')
+@click.option('--output', type=click.Path(allow_dash=True), help="Write results to this CSV file ('-' for stdout).")
+@click.option('--user', 'username', help="Save results to this user's comparison history instead.")
+@click.option('--workers', type=click.IntRange(min=1), default=os.cpu_count() or 1, show_default=True, help="Number of worker processes used to compute comparisons.")
+@click.option('--batch-size', type=click.IntRange(min=1), default=BULK_BATCH_SIZE, show_default=True, help="Number of pairs compared, written and checkpointed at a time.")
+@click.option('--checkpoint', help="Checkpoint used to resume an interrupted run: a file path with --output, or a name stored in the database with --user.")
+def bulk_compare_command(pairs_file, output, username, workers, batch_size, checkpoint):
+    """
+    Compares many asset pairs by market cap without going through /handle_comparison.
+    PAIRS_FILE (default stdin) has one `asset_type_1,ticker_1,asset_type_2,ticker_2` pair per line, where asset types are crypto or stock.
+    Each ticker is fetched once within the API rate limits, comparisons are computed across a process pool, and results are written in batches.
+    If an API stays throttled or unreachable, the run stops before the affected batch and can be resumed with the same --checkpoint.
+    """
+
+    if (output is None) == (username is None):
+        raise click.UsageError("Pass exactly one of --output or --user.")
+
+    try:
+        pairs = read_pairs(pairs_file)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+
+    if username:
+        user = User.query.filter_by(username=username).first()
+
+        if not user:
+            raise click.UsageError(f"No user named {username}.")
+
+        output_file = None
+        sink = DatabaseSink(user, checkpoint_name=checkpoint)
+    else:
+        # When resuming, append to the results already written instead of starting over.
+        # The csv module needs files opened with newline='', which click.open_file does not support.
+        resuming = load_checkpoint(checkpoint) > 0
+        output_file = sys.stdout if output == '-' else open(output, 'a' if resuming else 'w', newline='')
+        sink = CsvSink(output_file, write_header=not resuming, checkpoint_path=checkpoint)
+
+    try:
+        with click.progressbar(length=len(pairs), label='Comparing pairs', show_pos=True, file=sys.stderr) as progress:
+            progress.update(min(sink.load_progress(), len(pairs)))
+            stats = run_bulk_comparison(pairs, sink, workers, batch_size, on_batch=progress.update)
+    except ApiUnavailableError as exc:
+        raise click.ClickException(f"Stopped: {exc}. Rerun with the same --checkpoint to resume.")
+    finally:
+        if output_file not in (None, sys.stdout):
+            output_file.close()
+
+    compared = stats['compared'] + stats['failed']
+    elapsed = stats['elapsed_seconds']
+
+    click.echo(f"Compared {stats['compared']} pair(s), {stats['failed']} failed, {stats['skipped']} skipped from checkpoint.", err=True)
+    click.echo(f"Fetched {stats['quotes_fetched']} quote(s) in {stats['fetch_seconds']:.1f}s, computed in {stats['compare_seconds']:.1f}s, wrote in {stats['write_seconds']:.1f}s.", err=True)
+    click.echo(f"Throughput: {compared / elapsed if elapsed else 0:.1f} pairs/s over {elapsed:.1f}s.", err=True)
+
 # Routes
 @app.route('/')
 def home_page():
@@ -144,7 +233,8 @@ def handle_comparison():
     Gets the CSRF token from the request and validates it.
     If the CSRF token is invalid, a message is returned and a 400 status code is sent.
     If the CSRF token is valid, both asset types and tickers are retrieved from the request.
-    Assets are added to the database and compared, the comparison is added to the database, and the results are returned as a JSON object.
+    Assets are added to the database and compared, the comparison is added to the database in the same transaction, and the results are returned as a JSON object.
+    The optional `convert` currency (default USD) sets the currency of the returned prices and market caps.
     """
     
     try:
@@ -161,25 +251,30 @@ def handle_comparison():
     if asset_type_1 == asset_type_2 and ticker_1 == ticker_2:
         return (jsonify(message="Select two different assets."), 422)
 
-    asset_dict_1 = get_asset_info(asset_type_1, ticker_1)
-
-    if 'error' in asset_dict_1:
-        return (jsonify(message=asset_dict_1['error']), 400)
-
-    commit_asset_to_db(asset_dict_1)
+    # Resolve the FX rate before anything is written, so a conversion failure never leaves a partial comparison behind.
+    try:
+        currency = validate_currency(request.json.get('convert'))
+        rate = usd_rate(currency)
+    except UnsupportedCurrencyError as exc:
+        return (jsonify(message=str(exc)), 400)
+    except FxRatesUnavailableError as exc:
+        return (jsonify(message=str(exc)), 503)
 
-    asset_dict_2 = get_asset_info(asset_type_2, ticker_2)
+    try:
+        quote_1 = get_asset_info(asset_type_1, ticker_1)
+        quote_2 = get_asset_info(asset_type_2, ticker_2)
 
-    if 'error' in asset_dict_2:
-        return (jsonify(message=asset_dict_2['error']), 400)
+    except AssetLookupError as exc:
+        return (jsonify(message=str(exc)), 400)
 
-    commit_asset_to_db(asset_dict_2)
+    asset_1 = add_asset_to_db(quote_1)
+    asset_2 = add_asset_to_db(quote_2)
 
-    results_dict = compare_assets_mc(asset_dict_1, asset_dict_2)
+    result = compare_assets_mc(quote_1, quote_2)
 
-    commit_asset_comparison_to_db(asset_dict_1, asset_dict_2, results_dict)
+    commit_asset_comparison_to_db(asset_1, quote_1, asset_2, quote_2, result)
 
-    return (jsonify(results=results_dict), 200)
+    return (jsonify(results={**result.to_json(), **convert_quotes(quote_1, quote_2, rate, currency)}), 200)
 
 @app.route('/get_user_history', methods=['GET'])
 @login_required
@@ -187,10 +282,47 @@ def get_user_history():
     """
     Retrieves the user's comparison history.
     Comparison history is retrieved from the database and returned as a JSON object.
+    The optional `convert` query parameter (default USD) converts market caps into another currency at the current rate.
     """
     
     user = g.user
     history = UserAssetComparison.query.filter_by(user_id = user.id).all()
-    history_list = [{'comparison_timestamp': comparison.comparison_timestamp, 'name_1': comparison.asset_1.name, 'asset_1_market_cap_at_comparison': float(comparison.asset_1_market_cap_at_comparison),  'name_2': comparison.asset_2.name, 'asset_2_market_cap_at_comparison': float(comparison.asset_2_market_cap_at_comparison), 'percent_difference': float(comparison.percent_difference)} for comparison in history]
 
-    return (jsonify(history=history_list), 200)
\ No newline at end of file
+    try:
+        history_list = list(convert_history([serialize_comparison(comparison) for comparison in history], validate_currency(request.args.get('convert'))))
+    except UnsupportedCurrencyError as exc:
+        return (jsonify(message=str(exc)), 400)
+    except FxRatesUnavailableError as exc:
+        return (jsonify(message=str(exc)), 503)
+
+    return (jsonify(history=history_list), 200)
+
+@app.route('/export_history', methods=['GET'])
+@login_required
+def export_history():
+    """
+    Exports the user's comparison history as a file download.
+    The format is chosen with the `format` query parameter and can be `csv` (default) or `ndjson`.
+    The optional `convert` query parameter (default USD) converts market caps into another currency at the current rate.
+    Rows are streamed from the database as the response is written, so the full history is never held in memory.
+    """
+
+    export_format = request.args.get('format', 'csv')
+
+    try:
+        rows = convert_history(stream_user_history(g.user.id), validate_currency(request.args.get('convert')))
+    except UnsupportedCurrencyError as exc:
+        return (jsonify(message=str(exc)), 400)
+    except FxRatesUnavailableError as exc:
+        return (jsonify(message=str(exc)), 503)
+
+    if export_format == 'csv':
+        body, mimetype = history_to_csv(rows), 'text/csv'
+    elif export_format == 'ndjson':
+        body, mimetype = history_to_ndjson(rows), 'application/x-ndjson'
+    else:
+        return (jsonify(message="Export format must be csv or ndjson."), 400)
+
+    headers = {'Content-Disposition': f'attachment; filename=history.{export_format}'}
+
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
\ No newline at end of file
@@ -0,0 +1,297 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from models import db, UserAssetComparison, BulkComparisonCheckpoint
+from constants import CMC_REQUESTS_PER_MINUTE, AV_REQUESTS_PER_MINUTE, BULK_RETRY_DELAYS_SECONDS
+from func_and_dec import get_asset_info, add_asset_to_db, compare_assets_mc
+from quotes import AssetLookupError, ApiUnavailableError
+
+ASSET_TYPES = ('crypto', 'stock')
+
+CSV_FIELDS = ['asset_type_1', 'ticker_1', 'asset_type_2', 'ticker_2', 'name_1', 'price_1', 'market_cap_1', 'name_2', 'price_2', 'market_cap_2', 'percentage_change', 'multiple', 'error']
+
+class RateLimiter:
+    """
+    Spaces out requests to an API so no more than requests_per_minute are sent.
+    """
+
+    __slots__ = ('interval', 'next_request_at')
+
+    def __init__(self, requests_per_minute):
+        """
+        Creates a rate limiter that allows the first request straight away.
+        """
+
+        self.interval = 60 / requests_per_minute
+        self.next_request_at = 0
+
+    def wait(self):
+        """
+        Sleeps until the next request can be sent, then reserves it.
+        Requests are at least 60 / requests_per_minute seconds apart.
+        """
+
+        now = time.monotonic()
+
+        if self.next_request_at > now:
+            time.sleep(self.next_request_at - now)
+            now = self.next_request_at
+
+        self.next_request_at = now + self.interval
+
+def read_pairs(lines):
+    """
+    Parses comparison pairs from lines of `asset_type_1,ticker_1,asset_type_2,ticker_2`.
+    Blank lines, lines starting with # and a header line are skipped. Tickers are upper cased like the comparison form does.
+    Raises ValueError with the line number for a malformed line.
+    """
+
+    pairs = []
+
+    for line_number, row in enumerate(csv.reader(lines), start=1):
+        if not row or not ''.join(row).strip() or row[0].startswith('#') or row[0].strip() == 'asset_type_1':
+            continue
+
+        if len(row) != 4:
+            raise ValueError(f"Line {line_number}: expected asset_type_1,ticker_1,asset_type_2,ticker_2")
+
+        asset_type_1, ticker_1, asset_type_2, ticker_2 = (value.strip() for value in row)
+        asset_type_1, asset_type_2 = asset_type_1.lower(), asset_type_2.lower()
+
+        if asset_type_1 not in ASSET_TYPES or asset_type_2 not in ASSET_TYPES:
+            raise ValueError(f"Line {line_number}: asset type must be crypto or stock")
+
+        pairs.append((asset_type_1, ticker_1.upper(), asset_type_2, ticker_2.upper()))
+
+    return pairs
+
+def load_checkpoint(path):
+    """
+    Returns the number of pairs already processed according to the checkpoint file, or 0 if there is none.
+    """
+
+    if not path or not os.path.exists(path):
+        return 0
+
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)['processed']
+
+def save_checkpoint(path, processed):
+    """
+    Records the number of pairs processed so far.
+    The file is replaced atomically so an interrupted run never leaves a partial checkpoint.
+    """
+
+    if not path:
+        return
+
+    with open(f"{path}.tmp", 'w') as checkpoint_file:
+        json.dump({'processed': processed, 'updated_at': datetime.now().isoformat()}, checkpoint_file)
+
+    os.replace(f"{path}.tmp", path)
+
+def fetch_quotes(assets, quotes, errors, limiters):
+    """
+    Fetches quotes for (asset_type, ticker) keys that have not been fetched yet, through get_asset_info.
+    Successful quotes are added to quotes and failed lookups to errors, so every ticker is fetched at most once per run.
+    When an API is throttling requests or cannot be reached, the lookup is retried after each of BULK_RETRY_DELAYS_SECONDS.
+    Those errors are never cached; if the retries run out, ApiUnavailableError is raised so the run stops before the checkpoint moves on.
+    Returns the number of quotes fetched.
+    """
+
+    fetched = 0
+
+    for asset_type, ticker in assets:
+        key = (asset_type, ticker)
+
+        if key in quotes or key in errors:
+            continue
+
+        for delay in BULK_RETRY_DELAYS_SECONDS + [None]:
+            # The limiter is called before every API request, so the two Alpha Vantage requests of a stock quote are spaced too.
+            try:
+                quotes[key] = get_asset_info(asset_type, ticker, before_request=limiters[asset_type].wait)
+                break
+            except ApiUnavailableError:
+                if delay is None:
+                    raise
+
+                time.sleep(delay)
+            except AssetLookupError as exc:
+                errors[key] = str(exc)
+                break
+
+        fetched += 1
+
+    return fetched
+
+def compare_quotes(quote_1, quote_2):
+    """
+    Compares two quotes with compare_assets_mc in a worker process.
+    Returns a (result, error) tuple, so one bad pair does not stop the batch.
+    """
+
+    try:
+        return (compare_assets_mc(quote_1, quote_2), None)
+    except ArithmeticError as exc:
+        return (None, f"Cannot compare: {exc}")
+
+class CsvSink:
+    """
+    Writes comparison results to a CSV file, with progress kept in a checkpoint file.
+    The checkpoint is saved after each batch is flushed, so a crash between the two can repeat that batch in the CSV on resume.
+    """
+
+    def __init__(self, output_file, write_header, checkpoint_path=None):
+        """
+        Wraps an open file, writing the header row unless resuming into an existing file.
+        """
+
+        self.output_file = output_file
+        self.writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDS)
+        self.checkpoint_path = checkpoint_path
+
+        if write_header:
+            self.writer.writeheader()
+
+    def load_progress(self):
+        """
+        Returns the number of pairs already written according to the checkpoint file.
+        """
+
+        return load_checkpoint(self.checkpoint_path)
+
+    def write_batch(self, rows, processed):
+        """
+        Writes a batch of (pair, quote_1, quote_2, result, error) rows, flushes them to disk and records `processed` in the checkpoint file.
+        """
+
+        for (asset_type_1, ticker_1, asset_type_2, ticker_2), quote_1, quote_2, result, error in rows:
+            row = {'asset_type_1': asset_type_1, 'ticker_1': ticker_1, 'asset_type_2': asset_type_2, 'ticker_2': ticker_2, 'error': error}
+
+            if quote_1 and quote_2:
+                row.update({'name_1': quote_1.name, 'price_1': quote_1.price, 'market_cap_1': quote_1.market_cap, 'name_2': quote_2.name, 'price_2': quote_2.price, 'market_cap_2': quote_2.market_cap})
+
+            if result:
+                row.update(result._asdict())
+
+            self.writer.writerow(row)
+
+        self.output_file.flush()
+
+        save_checkpoint(self.checkpoint_path, processed)
+
+class DatabaseSink:
+    """
+    Writes comparison results to users_assets_comparisons for a user, one transaction per batch.
+    New or updated assets and the run's checkpoint are written in the same transaction as the comparisons, so resuming never inserts a batch twice.
+    Pairs that could not be compared are skipped.
+    """
+
+    def __init__(self, user, checkpoint_name=None):
+        """
+        Creates a sink that records comparisons for user, keeping progress under checkpoint_name in bulk_comparison_checkpoints.
+        """
+
+        self.user = user
+        self.checkpoint_name = checkpoint_name
+        self.asset_ids = {}
+
+    def load_progress(self):
+        """
+        Returns the number of pairs already committed according to the checkpoint in the database.
+        """
+
+        if not self.checkpoint_name:
+            return 0
+
+        checkpoint = BulkComparisonCheckpoint.query.get(self.checkpoint_name)
+
+        return checkpoint.processed if checkpoint else 0
+
+    def asset_id(self, quote):
+        """
+        Returns the id of the quote's asset, adding the asset to the current transaction the first time it is seen.
+        """
+
+        if quote.ticker not in self.asset_ids:
+            self.asset_ids[quote.ticker] = add_asset_to_db(quote).id
+
+        return self.asset_ids[quote.ticker]
+
+    def write_batch(self, rows, processed):
+        """
+        Adds a batch of (pair, quote_1, quote_2, result, error) rows and commits them, with their assets and `processed` as the checkpoint, together.
+        """
+
+        comparison_timestamp = datetime.now()
+        user_id = self.user.id
+
+        comparisons = [UserAssetComparison(user_id = user_id, asset_id_1 = self.asset_id(quote_1), asset_1_price_at_comparison = quote_1.price, asset_1_market_cap_at_comparison = quote_1.market_cap, asset_id_2 = self.asset_id(quote_2), asset_2_price_at_comparison = quote_2.price, asset_2_market_cap_at_comparison = quote_2.market_cap, comparison_timestamp = comparison_timestamp, percent_difference = result.percentage_change) for pair, quote_1, quote_2, result, error in rows if result]
+
+        db.session.add_all(comparisons)
+
+        if self.checkpoint_name:
+            db.session.merge(BulkComparisonCheckpoint(name = self.checkpoint_name, processed = processed, updated_at = comparison_timestamp))
+
+        db.session.commit()
+
+def run_bulk_comparison(pairs, sink, workers, batch_size, on_batch=None):
+    """
+    Compares pairs in batches and writes every batch to sink.
+    Quotes are fetched once per ticker within the API rate limits, and comparisons are computed across a pool of worker processes.
+    Pairs the sink has already recorded as processed are skipped, and the sink records progress with each batch it writes.
+    on_batch, if given, is called with the number of pairs in each finished batch.
+    Raises ApiUnavailableError if an API stays unavailable, leaving the current batch unwritten so a resumed run retries it.
+    Returns a dictionary of run statistics.
+    """
+
+    start = sink.load_progress()
+    limiters = {'crypto': RateLimiter(CMC_REQUESTS_PER_MINUTE), 'stock': RateLimiter(AV_REQUESTS_PER_MINUTE)}
+    quotes = {}
+    errors = {}
+    stats = {'skipped': start, 'compared': 0, 'failed': 0, 'quotes_fetched': 0, 'fetch_seconds': 0.0, 'compare_seconds': 0.0, 'write_seconds': 0.0}
+    started_at = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch_start in range(start, len(pairs), batch_size):
+            batch = pairs[batch_start:batch_start + batch_size]
+
+            phase_started_at = time.monotonic()
+            assets = [(pair[0], pair[1]) for pair in batch] + [(pair[2], pair[3]) for pair in batch]
+            stats['quotes_fetched'] += fetch_quotes(assets, quotes, errors, limiters)
+            stats['fetch_seconds'] += time.monotonic() - phase_started_at
+
+            comparable = [pair for pair in batch if (pair[0], pair[1]) in quotes and (pair[2], pair[3]) in quotes and pair[:2] != pair[2:]]
+
+            phase_started_at = time.monotonic()
+            chunksize = max(1, len(comparable) // (workers * 4))
+            outcomes = dict(zip(comparable, executor.map(compare_quotes, [quotes[(pair[0], pair[1])] for pair in comparable], [quotes[(pair[2], pair[3])] for pair in comparable], chunksize=chunksize)))
+            stats['compare_seconds'] += time.monotonic() - phase_started_at
+
+            rows = []
+
+            for pair in batch:
+                key_1, key_2 = (pair[0], pair[1]), (pair[2], pair[3])
+                result, error = outcomes.get(pair, (None, errors.get(key_1) or errors.get(key_2) or "Select two different assets."))
+
+                rows.append((pair, quotes.get(key_1), quotes.get(key_2), result, error))
+
+                if result:
+                    stats['compared'] += 1
+                else:
+                    stats['failed'] += 1
+
+            phase_started_at = time.monotonic()
+            sink.write_batch(rows, batch_start + len(batch))
+            stats['write_seconds'] += time.monotonic() - phase_started_at
+
+            if on_batch:
+                on_batch(len(batch))
+
+    stats['elapsed_seconds'] = time.monotonic() - started_at
+
+    return stats
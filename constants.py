@@ -11,4 +11,46 @@ CMC_BASE_URL = 'https://pro-api.coinmarketcap.com/v2/cryptocurrency/quotes/lates
 
 # Base URL for the Alpha Vantage API.
 # This is used for the stock data.
-AV_BASE_URL = 'https://www.alphavantage.co/query'
\ No newline at end of file
+AV_BASE_URL = 'https://www.alphavantage.co/query'
+
+# Number of comparison rows fetched per round trip when exporting a user's history.
+# The export streams through a server-side cursor, so this bounds memory use regardless of history size.
+EXPORT_YIELD_PER = 1000
+
+# Column order used for the CSV export of a user's comparison history.
+# Matches the keys returned for each comparison by the /get_user_history endpoint.
+HISTORY_FIELDS = ['comparison_timestamp', 'name_1', 'asset_1_market_cap_at_comparison', 'name_2', 'asset_2_market_cap_at_comparison', 'percent_difference', 'currency']
+
+# Number of whole months of comparisons kept in users_assets_comparisons.
+# Older comparisons are rolled up into users_assets_comparisons_daily and their partitions are dropped.
+COMPARISON_RETENTION_MONTHS = 12
+
+# Number of future monthly partitions of users_assets_comparisons created ahead of time by the retention job.
+COMPARISON_PARTITIONS_AHEAD = 3
+
+
+# Currencies that comparisons and history can be converted into, mapped to the number of decimal places values are rounded to.
+# All prices and market caps are stored in USD and converted with the cached FX rate matrix in fx.py.
+SUPPORTED_CURRENCIES = {'USD': 2, 'EUR': 2, 'GBP': 2, 'JPY': 2, 'BTC': 8}
+
+# Base currency that prices and market caps are stored in.
+BASE_CURRENCY = 'USD'
+
+# CoinMarketCap id of Bitcoin, whose quote in every supported currency is used to derive the FX rates.
+BITCOIN_CMC_ID = 1
+
+# Number of seconds FX rates are reused before they are refreshed in bulk from the CoinMarketCap API.
+FX_RATES_TTL_SECONDS = 3600
+
+
+# Request limits used by the bulk comparison runner so it stays within the API plans.
+# A stock quote needs two Alpha Vantage requests (GLOBAL_QUOTE and OVERVIEW), a crypto quote needs one CoinMarketCap request.
+CMC_REQUESTS_PER_MINUTE = 30
+AV_REQUESTS_PER_MINUTE = 5
+
+# Number of pairs the bulk comparison runner compares, writes and checkpoints at a time.
+BULK_BATCH_SIZE = 500
+
+# Seconds the bulk comparison runner waits before each retry when an API is throttling requests or cannot be reached.
+# Once the retries are used up the run stops before its checkpoint moves past the affected pairs.
+BULK_RETRY_DELAYS_SECONDS = [60, 300, 900]
@@ -1,10 +1,15 @@
+import csv
+import io
 import requests
 from datetime import datetime
-from flask import g, redirect, url_for, flash, session
+from flask import g, json, redirect, url_for, flash, session
 from functools import wraps
+from sqlalchemy.orm import joinedload
+from werkzeug.http import http_date
 from models import db, Asset, UserAssetComparison
-from constants import CURRENT_USER_KEY, CMC_BASE_URL, AV_BASE_URL
+from constants import CURRENT_USER_KEY, CMC_BASE_URL, AV_BASE_URL, EXPORT_YIELD_PER, HISTORY_FIELDS, BASE_CURRENCY
 from config import CMC_API_KEY, ALPHA_VANTAGE_API_KEY
+from quotes import AssetLookupError, ApiUnavailableError, ComparisonResult, parse_cmc_quote, parse_av_quote
 
 def login_required(f):
     """
@@ -33,113 +38,141 @@ def perform_logout():
 
     session.pop(CURRENT_USER_KEY, None)
 
-def get_asset_info(asset_type, ticker):
+def get_asset_info(asset_type, ticker, before_request=None):
     """
     Gets asset info from external APIs. 
-    Returns a dictionary with the asset's name, ticker, price, and market cap.
+    Returns a Quote with the asset's name, ticker, price, and market cap.
     Supports both crypto and stock assets.
+    If before_request is given, it is called before every API request, e.g. to wait for a rate limiter.
+    Raises AssetLookupError if the asset cannot be retrieved, or its subclass ApiUnavailableError if the API cannot be reached or is throttling requests.
     """
 
+    before_request = before_request or (lambda: None)
+
     try:
         if asset_type == 'crypto':
             # Get cryptocurrency data from CoinMarketCap API
             params = {'symbol': ticker}
             headers = {'X-CMC_PRO_API_KEY': CMC_API_KEY}
+            before_request()
             response = requests.get(CMC_BASE_URL, headers=headers, params=params)
-            data = response.json()
-
-            if 'data' not in data or ticker not in data['data'] or not data['data'][ticker]:
-                raise ValueError(f'No data is available for {ticker}')
-
-            # Extract data from response and round the price and market cap to 2 decimal places
-            name = data['data'][ticker][0]['name']
-            ticker_symbol = data['data'][ticker][0]['symbol']
-            price = round(float(data['data'][ticker][0]['quote']['USD']['price']), 2)
-            market_cap = round(float(data['data'][ticker][0]['quote']['USD']['market_cap']), 2)
-
-        else:
-            # Get stock data from Alpha Vantage API.
-            params_1 = {'function': 'GLOBAL_QUOTE', 'symbol': ticker, 'apikey': ALPHA_VANTAGE_API_KEY}
-            params_2 = {'function': 'OVERVIEW', 'symbol': ticker, 'apikey': ALPHA_VANTAGE_API_KEY}
-
-            # First request retrives the ticker and price
-            response_1 = requests.get(AV_BASE_URL, params=params_1)
-            data_1 = response_1.json()
-
-            # Second request retrieves the name and market cap
-            response_2 = requests.get(AV_BASE_URL, params=params_2)
-            data_2 = response_2.json()
-
-            if '05. price' not in data_1['Global Quote'] or 'MarketCapitalization' not in data_2:
-                raise ValueError(f'No data is available for {ticker}')
-
-            # Extract data from response and round the price and market cap to 2 decimal places
-            name = data_2['Name']
-            ticker_symbol = data_1['Global Quote']['01. symbol']
-            price = round(float(data_1['Global Quote']['05. price']), 2)
-            market_cap = round(float(data_2['MarketCapitalization']), 2)
-    
-    except ValueError as exc:
-        return {'error': str(exc)}
-    
+
+            return parse_cmc_quote(response.json(), ticker)
+
+        # Get stock data from Alpha Vantage API.
+        params_1 = {'function': 'GLOBAL_QUOTE', 'symbol': ticker, 'apikey': ALPHA_VANTAGE_API_KEY}
+        params_2 = {'function': 'OVERVIEW', 'symbol': ticker, 'apikey': ALPHA_VANTAGE_API_KEY}
+
+        # First request retrives the ticker and price
+        before_request()
+        response_1 = requests.get(AV_BASE_URL, params=params_1)
+
+        # Second request retrieves the name and market cap
+        before_request()
+        response_2 = requests.get(AV_BASE_URL, params=params_2)
+
+        return parse_av_quote(response_1.json(), response_2.json(), ticker)
+
+    except AssetLookupError:
+        raise
+
     except requests.exceptions.RequestException as exc:
-        return {'error': f"Network error: {exc}"}
+        raise ApiUnavailableError(f"Network error: {exc}") from exc
 
     except Exception as exc:
-        return {'error': f"Unexpected error: {exc}"}
-
-    return {'name': name, 'ticker': ticker_symbol, 'price': price, 'market_cap': market_cap}
+        raise AssetLookupError(f"Unexpected error: {exc}") from exc
 
-def commit_asset_to_db(asset_dict):
+def add_asset_to_db(quote):
     """
-    Commit asset info to db.
+    Adds asset info to the current transaction without committing it.
     If the asset already exists, update the price and market cap.
+    The session is flushed so the returned asset has its id.
     """
 
-    existing_asset = Asset.query.filter_by(ticker=asset_dict['ticker']).first()
+    asset = Asset.query.filter_by(ticker=quote.ticker).first()
 
-    if existing_asset:
+    if asset:
         # Update the price and market cap
-        existing_asset.price = asset_dict['price']
-        existing_asset.market_cap = asset_dict['market_cap']
+        asset.price = quote.price
+        asset.market_cap = quote.market_cap
     else:
         # Add a new asset
-        new_asset = Asset(name = asset_dict['name'], ticker = asset_dict['ticker'], price = asset_dict['price'], market_cap = asset_dict['market_cap'])
+        asset = Asset(name = quote.name, ticker = quote.ticker, price = quote.price, market_cap = quote.market_cap)
         
-        db.session.add(new_asset)
-    
-    db.session.commit()
+        db.session.add(asset)
+
+    db.session.flush()
+
+    return asset
 
-def compare_assets_mc(asset_dict_1, asset_dict_2):
+def compare_assets_mc(quote_1, quote_2):
     """
     Compares two assets by market cap.
-    Returns a dictionary with the percentage change and multiple between the two assets.
+    Returns a ComparisonResult with the percentage change and multiple between the two assets.
     """
 
-    mc1 = asset_dict_1['market_cap']
-    mc2 = asset_dict_2['market_cap']
+    return ComparisonResult.from_quotes(quote_1, quote_2)
 
-    percentage_change = round((mc2-mc1) / mc1 * 100, 2)
+def commit_asset_comparison_to_db(asset_1, quote_1, asset_2, quote_2, result):
+    """
+    Commits asset comparison to db.
+    Links the comparison to the user and the assets being compared.
+    The assets are the ones returned by add_asset_to_db, so they are not looked up again and are committed together with the comparison.
+    """
 
-    if mc1 < mc2:
-        multiple = round(mc2 / mc1, 2)
+    new_comparison = UserAssetComparison(user_id = g.user.id, asset_id_1 = asset_1.id, asset_1_price_at_comparison = quote_1.price, asset_1_market_cap_at_comparison = quote_1.market_cap, asset_id_2 = asset_2.id, asset_2_price_at_comparison = quote_2.price, asset_2_market_cap_at_comparison = quote_2.market_cap, comparison_timestamp = datetime.now(), percent_difference = result.percentage_change)
 
-    else:
-        multiple_fraction = round(mc2 / mc1, 7)
-        multiple = round(1 / multiple_fraction, 2)
+    db.session.add(new_comparison)
+    db.session.commit()
 
-    return {'percentage_change': percentage_change, 'multiple': multiple}
+def serialize_comparison(comparison):
+    """
+    Serializes a user asset comparison into a dictionary.
+    Shared by the JSON history endpoint and the streaming export so both return the same fields and values.
+    """
 
-def commit_asset_comparison_to_db(asset_dict_1, asset_dict_2, results_dict):
+    return {'comparison_timestamp': comparison.comparison_timestamp, 'name_1': comparison.asset_1.name, 'asset_1_market_cap_at_comparison': float(comparison.asset_1_market_cap_at_comparison), 'name_2': comparison.asset_2.name, 'asset_2_market_cap_at_comparison': float(comparison.asset_2_market_cap_at_comparison), 'percent_difference': float(comparison.percent_difference), 'currency': BASE_CURRENCY}
+
+def stream_user_history(user_id):
     """
-    Commits asset comparison to db.
-    Links the comparison to the user and the assets being compared.
+    Yields the user's comparisons one at a time.
+    Rows are fetched through a server-side cursor in batches of EXPORT_YIELD_PER, and both assets are loaded in the same query.
     """
-    
-    asset_1 = Asset.query.filter_by(ticker=asset_dict_1['ticker']).first()
-    asset_2 = Asset.query.filter_by(ticker=asset_dict_2['ticker']).first()
 
-    new_comparison = UserAssetComparison(user_id = g.user.id, asset_id_1 = asset_1.id, asset_1_price_at_comparison = asset_dict_1['price'], asset_1_market_cap_at_comparison = asset_dict_1['market_cap'], asset_id_2 = asset_2.id, asset_2_price_at_comparison = asset_dict_2['price'], asset_2_market_cap_at_comparison = asset_dict_2['market_cap'], comparison_timestamp = datetime.now(), percent_difference = results_dict['percentage_change'])
+    query = (UserAssetComparison.query
+             .filter_by(user_id=user_id)
+             .options(joinedload(UserAssetComparison.asset_1), joinedload(UserAssetComparison.asset_2))
+             .order_by(UserAssetComparison.id)
+             .yield_per(EXPORT_YIELD_PER))
 
-    db.session.add(new_comparison)
-    db.session.commit()
\ No newline at end of file
+    for comparison in query:
+        yield serialize_comparison(comparison)
+
+def history_to_csv(rows):
+    """
+    Converts serialized comparisons into CSV lines, starting with a header line.
+    The timestamp is formatted the same way Flask's JSON encoder formats it for /get_user_history.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=HISTORY_FIELDS)
+
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate(0)
+
+        row['comparison_timestamp'] = http_date(row['comparison_timestamp'].timetuple())
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+def history_to_ndjson(rows):
+    """
+    Converts serialized comparisons into newline delimited JSON, one comparison per line.
+    Uses Flask's JSON encoder so the output matches /get_user_history.
+    """
+
+    for row in rows:
+        yield json.dumps(row) + '\n'
@@ -0,0 +1,223 @@
+import requests
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert
+from models import db, FxRate
+from constants import CMC_BASE_URL, BITCOIN_CMC_ID, SUPPORTED_CURRENCIES, BASE_CURRENCY, FX_RATES_TTL_SECONDS
+from config import CMC_API_KEY
+
+# Cached rate matrix shared by all requests handled by this process. Rebuilt by get_fx_matrix once it is older than FX_RATES_TTL_SECONDS.
+_fx_matrix = None
+
+class CurrencyConversionError(Exception):
+    """
+    Base class for errors converting values into another currency.
+    The message is safe to show to the user.
+    """
+
+class UnsupportedCurrencyError(CurrencyConversionError):
+    """
+    Raised when a conversion is requested into a currency that is not in SUPPORTED_CURRENCIES.
+    """
+
+class FxRatesUnavailableError(CurrencyConversionError):
+    """
+    Raised when FX rates cannot be retrieved from the CoinMarketCap API.
+    """
+
+class FxRateMatrix:
+    """
+    Dense matrix of FX rates between every pair of supported currencies.
+    rates[i][j] is the number of units of currency j worth one unit of currency i.
+    """
+
+    __slots__ = ('currencies', 'index', 'rates', 'updated_at')
+
+    def __init__(self, usd_rates, updated_at):
+        """
+        Builds the matrix from the value of one USD in each currency.
+        """
+
+        self.currencies = list(usd_rates)
+        self.index = {currency: i for i, currency in enumerate(self.currencies)}
+        self.rates = [[usd_rates[to_currency] / usd_rates[from_currency] for to_currency in self.currencies] for from_currency in self.currencies]
+        self.updated_at = updated_at
+
+    def rate(self, from_currency, to_currency):
+        """
+        Returns the number of units of to_currency worth one unit of from_currency.
+        """
+
+        return self.rates[self.index[from_currency]][self.index[to_currency]]
+
+def validate_currency(currency):
+    """
+    Returns the currency code in upper case, or USD if no currency is given.
+    Raises UnsupportedCurrencyError if the currency is not a supported currency code.
+    """
+
+    if currency is None or currency == '':
+        return BASE_CURRENCY
+
+    if not isinstance(currency, str) or currency.upper() not in SUPPORTED_CURRENCIES:
+        raise UnsupportedCurrencyError(f"Unsupported currency. Choose one of: {', '.join(SUPPORTED_CURRENCIES)}.")
+
+    return currency.upper()
+
+def fetch_btc_quote(convert):
+    """
+    Gets Bitcoin's quote from the CoinMarketCap API in the given comma separated currencies.
+    Bitcoin is requested by its CoinMarketCap id, since several coins can share the BTC symbol.
+    Returns None if the API rejects the request, e.g. because the plan allows fewer convert currencies.
+    """
+
+    params = {'id': BITCOIN_CMC_ID, 'convert': convert}
+    headers = {'X-CMC_PRO_API_KEY': CMC_API_KEY}
+    response = requests.get(CMC_BASE_URL, headers=headers, params=params)
+    data = response.json()
+
+    if data.get('status', {}).get('error_code') or 'data' not in data:
+        return None
+
+    return data['data'][str(BITCOIN_CMC_ID)]['quote']
+
+def fetch_usd_rates():
+    """
+    Gets the value of one USD in every supported currency from the CoinMarketCap API.
+    Bitcoin is quoted in every fiat currency, and each fiat rate is derived from its Bitcoin price.
+    All currencies are requested at once. Plans limited to one convert currency per request fall back to one request per currency.
+    Raises FxRatesUnavailableError if the rates cannot be retrieved.
+    """
+
+    fiat_currencies = [currency for currency in SUPPORTED_CURRENCIES if currency != 'BTC']
+
+    try:
+        quote = fetch_btc_quote(','.join(fiat_currencies))
+
+        if quote is None:
+            quote = {}
+
+            for currency in fiat_currencies:
+                currency_quote = fetch_btc_quote(currency)
+
+                if currency_quote is None:
+                    raise FxRatesUnavailableError(f"FX rates are unavailable for {currency}")
+
+                quote.update(currency_quote)
+
+        btc_in_usd = float(quote[BASE_CURRENCY]['price'])
+
+        usd_rates = {currency: float(quote[currency]['price']) / btc_in_usd for currency in fiat_currencies}
+        usd_rates['BTC'] = 1 / btc_in_usd
+
+    except FxRatesUnavailableError:
+        raise
+
+    except requests.exceptions.RequestException as exc:
+        raise FxRatesUnavailableError(f"Network error: {exc}") from exc
+
+    except Exception as exc:
+        raise FxRatesUnavailableError(f"FX rates are unavailable: {exc}") from exc
+
+    return usd_rates
+
+def refresh_fx_rates():
+    """
+    Upserts fresh rates for every supported currency into the fx_rates table in a single statement.
+    Processes that refresh stale rates at the same time each overwrite the rows instead of conflicting on the primary key.
+    Returns the rate matrix built from the new rates.
+    """
+
+    usd_rates = fetch_usd_rates()
+    updated_at = datetime.now()
+
+    statement = insert(FxRate.__table__).values([{'currency': currency, 'usd_rate': rate, 'updated_at': updated_at} for currency, rate in usd_rates.items()])
+    statement = statement.on_conflict_do_update(index_elements=['currency'], set_={'usd_rate': statement.excluded.usd_rate, 'updated_at': statement.excluded.updated_at})
+
+    db.session.execute(statement)
+    db.session.commit()
+
+    return FxRateMatrix(usd_rates, updated_at)
+
+def load_fx_rates():
+    """
+    Builds the rate matrix from the fx_rates table.
+    Returns None if the table is missing a supported currency or its rates are older than FX_RATES_TTL_SECONDS.
+    """
+
+    rows = FxRate.query.filter(FxRate.currency.in_(SUPPORTED_CURRENCIES)).all()
+    usd_rates = {row.currency: float(row.usd_rate) for row in rows}
+
+    if set(usd_rates) != set(SUPPORTED_CURRENCIES):
+        return None
+
+    updated_at = min(row.updated_at for row in rows)
+
+    if datetime.now() - updated_at > timedelta(seconds=FX_RATES_TTL_SECONDS):
+        return None
+
+    return FxRateMatrix({currency: usd_rates[currency] for currency in SUPPORTED_CURRENCIES}, updated_at)
+
+def get_fx_matrix():
+    """
+    Returns the cached rate matrix.
+    Once the cache is older than FX_RATES_TTL_SECONDS, it is reloaded from the fx_rates table, which is refreshed from the API only when it is also stale.
+    """
+
+    global _fx_matrix
+
+    if _fx_matrix is None or datetime.now() - _fx_matrix.updated_at > timedelta(seconds=FX_RATES_TTL_SECONDS):
+        _fx_matrix = load_fx_rates() or refresh_fx_rates()
+
+    return _fx_matrix
+
+def usd_rate(currency):
+    """
+    Returns the number of units of currency worth one USD.
+    USD itself never touches the rate matrix.
+    """
+
+    if currency == BASE_CURRENCY:
+        return 1.0
+
+    return get_fx_matrix().rate(BASE_CURRENCY, currency)
+
+def convert_values(values, rate, currency):
+    """
+    Converts a batch of USD amounts with a single rate, rounding to the currency's decimal places.
+    """
+
+    decimals = SUPPORTED_CURRENCIES[currency]
+
+    return [round(float(value) * rate, decimals) for value in values]
+
+def convert_quotes(quote_1, quote_2, rate, currency):
+    """
+    Returns the prices and market caps of two quotes converted from USD into currency with rate.
+    """
+
+    price_1, market_cap_1, price_2, market_cap_2 = convert_values([quote_1.price, quote_1.market_cap, quote_2.price, quote_2.market_cap], rate, currency)
+
+    return {'currency': currency, 'price_1': price_1, 'market_cap_1': market_cap_1, 'price_2': price_2, 'market_cap_2': market_cap_2}
+
+def convert_history(rows, currency):
+    """
+    Converts the market caps of serialized comparisons from USD into currency at the current rate.
+    The rate is looked up once for the whole batch, and USD rows are returned untouched.
+    Rows are converted lazily, so this also works on the streaming export.
+    """
+
+    if currency == BASE_CURRENCY:
+        return rows
+
+    return _convert_history_rows(rows, usd_rate(currency), SUPPORTED_CURRENCIES[currency], currency)
+
+def _convert_history_rows(rows, rate, decimals, currency):
+    """
+    Yields each serialized comparison with its market caps multiplied by rate.
+    """
+
+    for row in rows:
+        row['asset_1_market_cap_at_comparison'] = round(row['asset_1_market_cap_at_comparison'] * rate, decimals)
+        row['asset_2_market_cap_at_comparison'] = round(row['asset_2_market_cap_at_comparison'] * rate, decimals)
+        row['currency'] = currency
+        yield row
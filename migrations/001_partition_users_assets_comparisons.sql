@@ -0,0 +1,81 @@
+-- Migration: partition users_assets_comparisons by month and add the daily rollup table
+-- Brings an existing database in line with schema.sql and models.py.
+-- Requires PostgreSQL 11 or later (default partitions, and foreign keys and indexes on partitioned tables).
+-- Run once with: psql -d <database> -f migrations/001_partition_users_assets_comparisons.sql
+
+BEGIN;
+
+-- comparison_timestamp becomes TIMESTAMP (without time zone) to match models.py.
+-- Databases built from the old schema.sql store it as TIMESTAMPTZ, and converting that to TIMESTAMP uses the session's TimeZone.
+-- The app writes naive local datetime.now() values, which the TIMESTAMPTZ column read in the server's default TimeZone.
+-- Run this migration with that same default (do not set PGTZ or TimeZone for the psql session), so existing rows keep their local times and stay in the same time base as new rows.
+
+-- Move the existing table out of the way, keeping its id sequence for the new table
+ALTER TABLE users_assets_comparisons RENAME TO users_assets_comparisons_old;
+ALTER TABLE users_assets_comparisons_old RENAME CONSTRAINT users_assets_comparisons_pkey TO users_assets_comparisons_old_pkey;
+
+-- Create the partitioned table
+CREATE TABLE users_assets_comparisons (
+    id INTEGER NOT NULL DEFAULT nextval('users_assets_comparisons_id_seq'),
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    asset_id_1 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    asset_1_price_at_comparison DECIMAL(16,2) NOT NULL,
+    asset_1_market_cap_at_comparison DECIMAL(16,2) NOT NULL,
+    asset_id_2 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    asset_2_price_at_comparison DECIMAL(16,2) NOT NULL,
+    asset_2_market_cap_at_comparison DECIMAL(16,2) NOT NULL,
+    comparison_timestamp TIMESTAMP NOT NULL,
+    percent_difference DECIMAL(16,2) NOT NULL,
+    PRIMARY KEY (id, comparison_timestamp)
+) PARTITION BY RANGE (comparison_timestamp);
+
+ALTER SEQUENCE users_assets_comparisons_id_seq OWNED BY users_assets_comparisons.id;
+
+CREATE TABLE users_assets_comparisons_default PARTITION OF users_assets_comparisons DEFAULT;
+
+CREATE INDEX ix_users_assets_comparisons_user_id ON users_assets_comparisons (user_id);
+CREATE INDEX ix_users_assets_comparisons_asset_id_1 ON users_assets_comparisons (asset_id_1);
+CREATE INDEX ix_users_assets_comparisons_asset_id_2 ON users_assets_comparisons (asset_id_2);
+
+-- Create one partition for every month that already has comparisons
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT DISTINCT CAST(date_trunc('month', comparison_timestamp) AS DATE) FROM users_assets_comparisons_old
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF users_assets_comparisons FOR VALUES FROM (%L) TO (%L)',
+            'users_assets_comparisons_p' || to_char(month, 'YYYY_MM'),
+            month,
+            month + INTERVAL '1 month'
+        );
+    END LOOP;
+END
+$$;
+
+-- Copy the existing comparisons into their partitions
+INSERT INTO users_assets_comparisons
+SELECT id, user_id, asset_id_1, asset_1_price_at_comparison, asset_1_market_cap_at_comparison, asset_id_2, asset_2_price_at_comparison, asset_2_market_cap_at_comparison, comparison_timestamp, percent_difference
+FROM users_assets_comparisons_old;
+
+DROP TABLE users_assets_comparisons_old;
+
+-- Create the daily rollup table
+CREATE TABLE users_assets_comparisons_daily (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    asset_id_1 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    asset_id_2 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    comparison_date DATE NOT NULL,
+    comparison_count INTEGER NOT NULL,
+    avg_percent_difference DECIMAL(16,2) NOT NULL,
+    min_percent_difference DECIMAL(16,2) NOT NULL,
+    max_percent_difference DECIMAL(16,2) NOT NULL,
+    PRIMARY KEY (user_id, asset_id_1, asset_id_2, comparison_date)
+);
+
+CREATE INDEX ix_users_assets_comparisons_daily_asset_id_1 ON users_assets_comparisons_daily (asset_id_1);
+CREATE INDEX ix_users_assets_comparisons_daily_asset_id_2 ON users_assets_comparisons_daily (asset_id_2);
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Migration: add the fx_rates table used for multi-currency comparisons
+-- Brings an existing database in line with schema.sql and models.py.
+-- Run once with: psql -d <database> -f migrations/002_create_fx_rates.sql
+
+BEGIN;
+
+CREATE TABLE fx_rates (
+    currency VARCHAR(10) PRIMARY KEY,
+    usd_rate DECIMAL(30,12) NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Migration: add the bulk_comparison_checkpoints table used to resume `flask bulk-compare --user` runs
+-- Brings an existing database in line with schema.sql and models.py.
+-- Run once with: psql -d <database> -f migrations/003_create_bulk_comparison_checkpoints.sql
+
+BEGIN;
+
+CREATE TABLE bulk_comparison_checkpoints (
+    name VARCHAR(255) PRIMARY KEY,
+    processed INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+COMMIT;
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from sqlalchemy import DDL, event
 
 db = SQLAlchemy()  # Creates SQLAlchemy's instance for database interaction
 bcrypt = Bcrypt()  # Creates Bcrypt's instance for password hashing
@@ -88,6 +89,9 @@ class UserAssetComparison(db.Model):
 
     __tablename__ = 'users_assets_comparisons'
 
+    # Range partitioned by month on comparison_timestamp. Monthly partitions are created and dropped by retention.py.
+    __table_args__ = {'postgresql_partition_by': 'RANGE (comparison_timestamp)'}
+
     def __repr__(self):
         """Shows info about user asset comparison."""
 
@@ -96,25 +100,99 @@ class UserAssetComparison(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='cascade'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='cascade'), nullable=False, index=True)
 
-    asset_id_1 = db.Column(db.Integer, db.ForeignKey('assets.id', ondelete='cascade'), nullable=False)
+    asset_id_1 = db.Column(db.Integer, db.ForeignKey('assets.id', ondelete='cascade'), nullable=False, index=True)
 
     asset_1_price_at_comparison = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
 
     asset_1_market_cap_at_comparison = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
 
-    asset_id_2 = db.Column(db.Integer, db.ForeignKey('assets.id', ondelete='cascade'), nullable=False)
+    asset_id_2 = db.Column(db.Integer, db.ForeignKey('assets.id', ondelete='cascade'), nullable=False, index=True)
 
     asset_2_price_at_comparison = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
 
     asset_2_market_cap_at_comparison = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
 
-    comparison_timestamp = db.Column(db.DateTime, nullable=False)
+    # Part of the primary key because Postgres requires the partition key in every unique constraint of a partitioned table.
+    comparison_timestamp = db.Column(db.DateTime, primary_key=True, nullable=False)
 
     percent_difference = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
 
     # Relationships
     asset_1 = db.relationship('Asset', foreign_keys=[asset_id_1], backref='comparison_as_asset_1')
     
-    asset_2 = db.relationship('Asset', foreign_keys=[asset_id_2], backref='comparison_as_asset_2')
\ No newline at end of file
+    asset_2 = db.relationship('Asset', foreign_keys=[asset_id_2], backref='comparison_as_asset_2')
+
+# Rows outside every monthly partition land in the default partition, so inserts never fail before retention.py has created the partitions.
+event.listen(UserAssetComparison.__table__, 'after_create', DDL("CREATE TABLE users_assets_comparisons_default PARTITION OF users_assets_comparisons DEFAULT"))
+
+class UserAssetComparisonDaily(db.Model):
+    """
+    Daily rollup of user asset comparisons in the database.
+    Comparisons older than the retention period are aggregated into this table before their partition is dropped.
+    """
+
+    __tablename__ = 'users_assets_comparisons_daily'
+
+    def __repr__(self):
+        """Shows info about daily user asset comparison rollup."""
+
+        uacd = self
+        return f"<UserAssetComparisonDaily: User ID={uacd.user_id}, Asset ID 1={uacd.asset_id_1}, Asset ID 2={uacd.asset_id_2}, Comparison Date={uacd.comparison_date}, Comparison Count={uacd.comparison_count}, Avg Percent Difference={uacd.avg_percent_difference}>"
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='cascade'), primary_key=True)
+
+    asset_id_1 = db.Column(db.Integer, db.ForeignKey('assets.id', ondelete='cascade'), primary_key=True, index=True)
+
+    asset_id_2 = db.Column(db.Integer, db.ForeignKey('assets.id', ondelete='cascade'), primary_key=True, index=True)
+
+    comparison_date = db.Column(db.Date, primary_key=True)
+
+    comparison_count = db.Column(db.Integer, nullable=False)
+
+    avg_percent_difference = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
+
+    min_percent_difference = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
+
+    max_percent_difference = db.Column(db.Numeric(precision=16, scale=2), nullable=False)
+
+class FxRate(db.Model):
+    """
+    FX rate model for representing the value of one USD in another currency.
+    Rows are replaced in bulk by fx.py and loaded into an in-memory rate matrix.
+    """
+
+    __tablename__ = 'fx_rates'
+
+    def __repr__(self):
+        """Shows info about FX rate."""
+
+        fx = self
+        return f"<FxRate: Currency={fx.currency}, USD Rate={fx.usd_rate}, Updated At={fx.updated_at}>"
+
+    currency = db.Column(db.String(10), primary_key=True)
+
+    usd_rate = db.Column(db.Numeric(precision=30, scale=12), nullable=False)
+
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class BulkComparisonCheckpoint(db.Model):
+    """
+    Bulk comparison checkpoint model for recording how far a `flask bulk-compare --user` run has got.
+    Updated in the same transaction as each batch of comparisons, so a resumed run never inserts a batch twice.
+    """
+
+    __tablename__ = 'bulk_comparison_checkpoints'
+
+    def __repr__(self):
+        """Shows info about bulk comparison checkpoint."""
+
+        bcc = self
+        return f"<BulkComparisonCheckpoint: Name={bcc.name}, Processed={bcc.processed}, Updated At={bcc.updated_at}>"
+
+    name = db.Column(db.String(255), primary_key=True)
+
+    processed = db.Column(db.Integer, nullable=False)
+
+    updated_at = db.Column(db.DateTime, nullable=False)
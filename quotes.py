@@ -0,0 +1,107 @@
+from collections import namedtuple
+from decimal import Decimal
+
+# Prices, market caps and comparison results are stored with 2 decimal places, matching Numeric(16, 2) in models.py.
+CENTS = Decimal('0.01')
+
+class AssetLookupError(Exception):
+    """
+    Raised when an asset's quote cannot be retrieved or parsed.
+    The message is safe to show to the user.
+    """
+
+class ApiUnavailableError(AssetLookupError):
+    """
+    Raised when an API cannot be reached or is throttling requests.
+    Unlike other lookup errors, the same request may succeed later.
+    """
+
+# CoinMarketCap status error codes for exceeded minute, daily, monthly and IP rate limits.
+CMC_RATE_LIMIT_ERROR_CODES = {429, 1008, 1009, 1010, 1011}
+
+class Quote(namedtuple('Quote', ['name', 'ticker', 'price', 'market_cap'])):
+    """
+    Immutable quote for an asset.
+    Price and market cap are Decimals rounded to 2 decimal places so they can be written to the database as is.
+    """
+
+    __slots__ = ()
+
+class ComparisonResult(namedtuple('ComparisonResult', ['percentage_change', 'multiple'])):
+    """
+    Immutable result of comparing two assets by market cap.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_quotes(cls, quote_1, quote_2):
+        """
+        Compares two quotes by market cap.
+        The percentage change is from quote_1 to quote_2, and the multiple is how many times larger the bigger market cap is.
+        """
+
+        mc1 = quote_1.market_cap
+        mc2 = quote_2.market_cap
+
+        percentage_change = ((mc2 - mc1) / mc1 * 100).quantize(CENTS)
+
+        if mc1 < mc2:
+            multiple = (mc2 / mc1).quantize(CENTS)
+
+        else:
+            multiple_fraction = (mc2 / mc1).quantize(Decimal('0.0000001'))
+            multiple = (1 / multiple_fraction).quantize(CENTS)
+
+        return cls(percentage_change, multiple)
+
+    def to_json(self):
+        """
+        Returns the result as a dictionary of floats that can be passed to jsonify.
+        """
+
+        return {'percentage_change': float(self.percentage_change), 'multiple': float(self.multiple)}
+
+def to_cents(value):
+    """
+    Converts a number or numeric string from an API payload into a Decimal rounded to 2 decimal places.
+    """
+
+    return Decimal(str(value)).quantize(CENTS)
+
+def parse_cmc_quote(data, ticker):
+    """
+    Builds a Quote from a CoinMarketCap quotes response.
+    Only the name, symbol, price and market cap of the first matching asset are read.
+    """
+
+    status = data.get('status') or {}
+
+    if status.get('error_code') in CMC_RATE_LIMIT_ERROR_CODES:
+        raise ApiUnavailableError(f"CoinMarketCap request limit reached: {status.get('error_message')}")
+
+    if 'data' not in data or ticker not in data['data'] or not data['data'][ticker]:
+        raise AssetLookupError(f'No data is available for {ticker}')
+
+    asset = data['data'][ticker][0]
+    usd = asset['quote']['USD']
+
+    return Quote(asset['name'], asset['symbol'], to_cents(usd['price']), to_cents(usd['market_cap']))
+
+def parse_av_quote(global_quote_data, overview_data, ticker):
+    """
+    Builds a Quote from Alpha Vantage GLOBAL_QUOTE and OVERVIEW responses.
+    The ticker and price come from the global quote; the name and market cap come from the overview.
+    """
+
+    # Alpha Vantage answers throttled requests with a Note or Information message instead of data.
+    for data in (global_quote_data, overview_data):
+        if 'Note' in data or 'Information' in data:
+            raise ApiUnavailableError(f"Alpha Vantage request limit reached: {data.get('Note') or data.get('Information')}")
+
+    global_quote = global_quote_data.get('Global Quote', {})
+
+    if '05. price' not in global_quote or 'MarketCapitalization' not in overview_data:
+        raise AssetLookupError(f'No data is available for {ticker}')
+
+    return Quote(overview_data['Name'], global_quote['01. symbol'], to_cents(global_quote['05. price']), to_cents(overview_data['MarketCapitalization']))
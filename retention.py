@@ -0,0 +1,124 @@
+import re
+from datetime import date
+from sqlalchemy import text
+from models import db
+
+# users_assets_comparisons is range partitioned by month on comparison_timestamp.
+# Each month lives in its own partition named users_assets_comparisons_pYYYY_MM.
+# Rows that fall outside every monthly partition are stored in users_assets_comparisons_default.
+PARENT_TABLE = 'users_assets_comparisons'
+DEFAULT_PARTITION = 'users_assets_comparisons_default'
+PARTITION_NAME_RE = re.compile(r'^users_assets_comparisons_p(\d{4})_(\d{2})$')
+
+# Aggregates comparisons into one row per user, asset pair and day.
+# If the day was already rolled up (e.g. from the default partition), the counts are added and the averages are weighted.
+ROLLUP_SQL = """
+    INSERT INTO users_assets_comparisons_daily (user_id, asset_id_1, asset_id_2, comparison_date, comparison_count, avg_percent_difference, min_percent_difference, max_percent_difference)
+    SELECT user_id, asset_id_1, asset_id_2, CAST(comparison_timestamp AS DATE), COUNT(*), AVG(percent_difference), MIN(percent_difference), MAX(percent_difference)
+    FROM {table}
+    WHERE comparison_timestamp < :cutoff
+    GROUP BY user_id, asset_id_1, asset_id_2, CAST(comparison_timestamp AS DATE)
+    ON CONFLICT (user_id, asset_id_1, asset_id_2, comparison_date) DO UPDATE SET
+        avg_percent_difference = (users_assets_comparisons_daily.avg_percent_difference * users_assets_comparisons_daily.comparison_count + EXCLUDED.avg_percent_difference * EXCLUDED.comparison_count) / (users_assets_comparisons_daily.comparison_count + EXCLUDED.comparison_count),
+        min_percent_difference = LEAST(users_assets_comparisons_daily.min_percent_difference, EXCLUDED.min_percent_difference),
+        max_percent_difference = GREATEST(users_assets_comparisons_daily.max_percent_difference, EXCLUDED.max_percent_difference),
+        comparison_count = users_assets_comparisons_daily.comparison_count + EXCLUDED.comparison_count
+"""
+
+def add_months(month, months):
+    """
+    Returns the first day of the month that is `months` months after `month`.
+    A negative number of months moves backwards.
+    """
+
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    """
+    Returns the name of the monthly partition holding comparisons from `month`.
+    """
+
+    return f"{PARENT_TABLE}_p{month.year}_{month.month:02d}"
+
+def create_monthly_partitions(today, months_ahead):
+    """
+    Creates the partitions for the current month and the next `months_ahead` months.
+    Partitions that already exist are left alone.
+    Any rows for a new month that already landed in the default partition are moved into the new partition before it is attached.
+    """
+
+    existing = list_monthly_partitions()
+    start = add_months(today, 0)
+
+    for offset in range(months_ahead + 1):
+        month = add_months(start, offset)
+
+        if month in existing:
+            continue
+
+        name = partition_name(month)
+        bounds = {'start': month, 'end': add_months(month, 1)}
+
+        db.session.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        db.session.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE comparison_timestamp >= :start AND comparison_timestamp < :end"), bounds)
+        db.session.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE comparison_timestamp >= :start AND comparison_timestamp < :end"), bounds)
+        db.session.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"))
+        db.session.commit()
+
+def list_monthly_partitions():
+    """
+    Returns a dictionary of the existing monthly partitions, mapping the first day of each month to its partition name.
+    """
+
+    result = db.session.execute(text("SELECT child.relname FROM pg_inherits JOIN pg_class parent ON parent.oid = pg_inherits.inhparent JOIN pg_class child ON child.oid = pg_inherits.inhrelid WHERE parent.relname = :parent"), {'parent': PARENT_TABLE})
+
+    partitions = {}
+
+    for (name,) in result:
+        match = PARTITION_NAME_RE.match(name)
+
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+
+    return partitions
+
+def rollup_and_drop_expired(today, retention_months):
+    """
+    Rolls up comparisons older than `retention_months` whole months into users_assets_comparisons_daily.
+    Expired monthly partitions are dropped and expired rows in the default partition are deleted.
+    Each partition is rolled up and dropped in a single transaction.
+    Returns the names of the dropped partitions.
+    """
+
+    cutoff = add_months(today, -retention_months)
+    dropped = []
+
+    for month, name in sorted(list_monthly_partitions().items()):
+        if month >= cutoff:
+            continue
+
+        db.session.execute(text(ROLLUP_SQL.format(table=name)), {'cutoff': cutoff})
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+
+        dropped.append(name)
+
+    db.session.execute(text(ROLLUP_SQL.format(table=DEFAULT_PARTITION)), {'cutoff': cutoff})
+    db.session.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE comparison_timestamp < :cutoff"), {'cutoff': cutoff})
+    db.session.commit()
+
+    return dropped
+
+def apply_retention(retention_months, months_ahead, today=None):
+    """
+    Runs the retention job for users_assets_comparisons.
+    Creates upcoming monthly partitions, then rolls up and drops the expired ones.
+    Returns the names of the dropped partitions.
+    """
+
+    today = today or date.today()
+
+    create_monthly_partitions(today, months_ahead)
+
+    return rollup_and_drop_expired(today, retention_months)
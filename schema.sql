@@ -1,10 +1,11 @@
 -- Schema Design for Capstone Project
+-- Requires PostgreSQL 11 or later for the partitioned users_assets_comparisons table.
 
 -- Create User table
 CREATE TABLE users (
     id SERIAL PRIMARY KEY,
     username TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL,
+    password TEXT NOT NULL
 );
 
 -- Create Asset table
@@ -13,12 +14,14 @@ CREATE TABLE assets (
     name TEXT UNIQUE NOT NULL,
     ticker TEXT UNIQUE NOT NULL,
     price DECIMAL(16,2) NOT NULL CHECK (price >= 0),
-    market_cap DECIMAL(16,2) NOT NULL CHECK (market_cap >= 0),
+    market_cap DECIMAL(16,2) NOT NULL CHECK (market_cap >= 0)
 );
 
 -- Create ComparisonHistory table
+-- Range partitioned by month on comparison_timestamp. Monthly partitions are created and dropped by `flask apply-retention`.
+-- comparison_timestamp is TIMESTAMP (without time zone) to match the DateTime column in models.py.
 CREATE TABLE users_assets_comparisons (
-    id SERIAL PRIMARY KEY,
+    id SERIAL NOT NULL,
     user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     asset_id_1 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
     asset_1_price_at_comparison DECIMAL(16,2) NOT NULL,
@@ -26,6 +29,47 @@ CREATE TABLE users_assets_comparisons (
     asset_id_2 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
     asset_2_price_at_comparison DECIMAL(16,2) NOT NULL,
     asset_2_market_cap_at_comparison DECIMAL(16,2) NOT NULL,
-    comparison_timestamp TIMESTAMPTZ NOT NULL,
-    percent_difference DECIMAL(16,2) NOT NULL
+    comparison_timestamp TIMESTAMP NOT NULL,
+    percent_difference DECIMAL(16,2) NOT NULL,
+    PRIMARY KEY (id, comparison_timestamp)
+) PARTITION BY RANGE (comparison_timestamp);
+
+-- Catches rows outside every monthly partition
+CREATE TABLE users_assets_comparisons_default PARTITION OF users_assets_comparisons DEFAULT;
+
+CREATE INDEX ix_users_assets_comparisons_user_id ON users_assets_comparisons (user_id);
+CREATE INDEX ix_users_assets_comparisons_asset_id_1 ON users_assets_comparisons (asset_id_1);
+CREATE INDEX ix_users_assets_comparisons_asset_id_2 ON users_assets_comparisons (asset_id_2);
+
+-- Create ComparisonHistoryDaily table
+-- Daily rollup of comparisons older than the retention period
+CREATE TABLE users_assets_comparisons_daily (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    asset_id_1 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    asset_id_2 INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    comparison_date DATE NOT NULL,
+    comparison_count INTEGER NOT NULL,
+    avg_percent_difference DECIMAL(16,2) NOT NULL,
+    min_percent_difference DECIMAL(16,2) NOT NULL,
+    max_percent_difference DECIMAL(16,2) NOT NULL,
+    PRIMARY KEY (user_id, asset_id_1, asset_id_2, comparison_date)
+);
+
+CREATE INDEX ix_users_assets_comparisons_daily_asset_id_1 ON users_assets_comparisons_daily (asset_id_1);
+CREATE INDEX ix_users_assets_comparisons_daily_asset_id_2 ON users_assets_comparisons_daily (asset_id_2);
+
+-- Create FxRate table
+-- Value of one USD in each supported currency, replaced in bulk by `flask refresh-fx-rates`
+CREATE TABLE fx_rates (
+    currency VARCHAR(10) PRIMARY KEY,
+    usd_rate DECIMAL(30,12) NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+-- Create BulkComparisonCheckpoint table
+-- Progress of `flask bulk-compare --user` runs, updated in the same transaction as each batch
+CREATE TABLE bulk_comparison_checkpoints (
+    name VARCHAR(255) PRIMARY KEY,
+    processed INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL
 );
@@ -0,0 +1,160 @@
+import io
+import os
+import tempfile
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import patch
+
+from quotes import AssetLookupError, ApiUnavailableError, Quote
+
+os.environ['DATABASE_URL'] = "postgresql:///mcm_test_db"
+
+from app import app
+from bulk import CsvSink, RateLimiter, fetch_quotes, read_pairs, run_bulk_comparison
+
+QUOTES = {'FAKE1': Quote('FakeAsset1', 'FAKE1', Decimal('100.00'), Decimal('1000.00')), 'FAKE2': Quote('FakeAsset2', 'FAKE2', Decimal('200.00'), Decimal('2000.00'))}
+
+def fake_get_asset_info(asset_type, ticker, before_request=None):
+    """Returns a sample quote, or raises AssetLookupError for an unknown ticker. Calls before_request once per API request, like get_asset_info."""
+
+    for _ in range(1 if asset_type == 'crypto' else 2):
+        if before_request:
+            before_request()
+
+    if ticker not in QUOTES:
+        raise AssetLookupError(f'No data is available for {ticker}')
+
+    return QUOTES[ticker]
+
+class BulkComparisonTestCase(TestCase):
+    """Test the bulk comparison runner."""
+
+    def setUp(self):
+        """Create sample pairs."""
+
+        self.pairs = read_pairs(['asset_type_1,ticker_1,asset_type_2,ticker_2', 'stock,fake1,crypto,FAKE2', '', '# comment', 'crypto,FAKE2,stock,FAKE1', 'stock,FAKE1,stock,MISSING'])
+
+    def test_read_pairs(self):
+        """Tests that pairs are parsed, normalized and that malformed lines are rejected."""
+
+        self.assertEqual(self.pairs, [('stock', 'FAKE1', 'crypto', 'FAKE2'), ('crypto', 'FAKE2', 'stock', 'FAKE1'), ('stock', 'FAKE1', 'stock', 'MISSING')])
+
+        with self.assertRaises(ValueError):
+            read_pairs(['stock,FAKE1,bond,FAKE2'])
+
+    @patch('bulk.AV_REQUESTS_PER_MINUTE', 60000)
+    @patch('bulk.get_asset_info', side_effect=fake_get_asset_info)
+    def test_run_bulk_comparison_csv(self, get_asset_info):
+        """Tests that each ticker is fetched once and results are written to CSV."""
+
+        output = io.StringIO()
+        stats = run_bulk_comparison(self.pairs, CsvSink(output, write_header=True), workers=2, batch_size=2)
+        lines = output.getvalue().splitlines()
+
+        self.assertEqual(get_asset_info.call_count, 3)
+        self.assertEqual(stats['compared'], 2)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].endswith(',100.00,2.00,'))
+        self.assertTrue(lines[2].endswith(',-50.00,2.00,'))
+        self.assertIn('No data is available for MISSING', lines[3])
+
+    @patch('bulk.AV_REQUESTS_PER_MINUTE', 60000)
+    @patch('bulk.get_asset_info', side_effect=fake_get_asset_info)
+    def test_run_bulk_comparison_resume(self, get_asset_info):
+        """Tests that a run resumes after the pairs recorded in the checkpoint."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'run.checkpoint')
+
+            run_bulk_comparison(self.pairs[:2], CsvSink(io.StringIO(), write_header=True, checkpoint_path=checkpoint), workers=1, batch_size=2)
+
+            output = io.StringIO()
+            stats = run_bulk_comparison(self.pairs, CsvSink(output, write_header=False, checkpoint_path=checkpoint), workers=1, batch_size=2)
+
+        self.assertEqual(stats['skipped'], 2)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+
+    @patch('bulk.time.sleep')
+    @patch('bulk.get_asset_info', side_effect=[ApiUnavailableError('Alpha Vantage request limit reached'), QUOTES['FAKE1']])
+    def test_fetch_quotes_retries_unavailable_api(self, get_asset_info, sleep):
+        """Tests that throttled or failed API requests are retried instead of being recorded as failed lookups."""
+
+        quotes, errors = {}, {}
+        fetch_quotes([('stock', 'FAKE1')], quotes, errors, {'stock': RateLimiter(60000)})
+
+        self.assertEqual(quotes, {('stock', 'FAKE1'): QUOTES['FAKE1']})
+        self.assertEqual(errors, {})
+        self.assertEqual(get_asset_info.call_count, 2)
+        sleep.assert_called_once_with(60)
+
+    @patch('bulk.time.sleep')
+    @patch('bulk.AV_REQUESTS_PER_MINUTE', 60000)
+    @patch('bulk.get_asset_info', side_effect=ApiUnavailableError('Alpha Vantage request limit reached'))
+    def test_run_bulk_comparison_stops_when_api_unavailable(self, get_asset_info, sleep):
+        """Tests that a run stops without moving its checkpoint when an API stays unavailable."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'run.checkpoint')
+            output = io.StringIO()
+
+            with self.assertRaises(ApiUnavailableError):
+                run_bulk_comparison(self.pairs, CsvSink(output, write_header=True, checkpoint_path=checkpoint), workers=1, batch_size=2)
+
+            self.assertFalse(os.path.exists(checkpoint))
+
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+
+    def test_rate_limiter_spaces_every_request(self):
+        """Tests that both Alpha Vantage requests of a stock quote are spaced by the rate limit."""
+
+        clock = {'now': 0.0}
+        request_times = []
+
+        def record_request(asset_type, ticker, before_request=None):
+            for _ in range(2):
+                before_request()
+                request_times.append(clock['now'])
+
+            return QUOTES['FAKE1']
+
+        def sleep(seconds):
+            clock['now'] += seconds
+
+        with patch('bulk.time.monotonic', side_effect=lambda: clock['now']), patch('bulk.time.sleep', side_effect=sleep), patch('bulk.get_asset_info', side_effect=record_request):
+            fetch_quotes([('stock', 'A'), ('stock', 'B'), ('stock', 'C')], {}, {}, {'stock': RateLimiter(5)})
+
+        self.assertEqual(request_times, [0, 12, 24, 36, 48, 60])
+        self.assertTrue(all(len([t for t in request_times if start <= t < start + 60]) <= 5 for start in request_times))
+
+    @patch('bulk.AV_REQUESTS_PER_MINUTE', 60000)
+    @patch('bulk.get_asset_info', side_effect=fake_get_asset_info)
+    def test_bulk_compare_command_csv(self, get_asset_info):
+        """Tests that the bulk-compare command writes results to a CSV file."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            pairs_path = os.path.join(directory, 'pairs.csv')
+            output_path = os.path.join(directory, 'results.csv')
+
+            with open(pairs_path, 'w') as pairs_file:
+                pairs_file.write('stock,FAKE1,crypto,FAKE2\nstock,FAKE1,stock,MISSING\n')
+
+            result = app.test_cli_runner().invoke(args=['bulk-compare', pairs_path, '--output', output_path, '--workers', '1'])
+
+            with open(output_path) as output_file:
+                lines = output_file.read().splitlines()
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('asset_type_1,ticker_1'))
+        self.assertTrue(lines[1].endswith(',100.00,2.00,'))
+        self.assertIn('No data is available for MISSING', lines[2])
+
+    def test_bulk_compare_command_invalid_options(self):
+        """Tests that the bulk-compare command rejects non-positive workers and batch sizes."""
+
+        runner = app.test_cli_runner()
+
+        self.assertEqual(runner.invoke(args=['bulk-compare', '--output', '-', '--workers', '0'], input='').exit_code, 2)
+        self.assertEqual(runner.invoke(args=['bulk-compare', '--output', '-', '--batch-size', '0'], input='').exit_code, 2)
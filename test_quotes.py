@@ -0,0 +1,62 @@
+from decimal import Decimal
+from unittest import TestCase
+
+from quotes import AssetLookupError, ApiUnavailableError, ComparisonResult, Quote, parse_cmc_quote, parse_av_quote
+
+class QuoteTestCase(TestCase):
+    """Test Quote and ComparisonResult value types and the API payload parsers."""
+
+    def setUp(self):
+        """Create sample quotes."""
+
+        self.quote_1 = Quote('FakeAsset1', 'FAKE1', Decimal('100.00'), Decimal('1000.00'))
+        self.quote_2 = Quote('FakeAsset2', 'FAKE2', Decimal('200.00'), Decimal('2000.00'))
+
+    def test_quote_is_immutable(self):
+        """Tests that quotes cannot be changed or given new attributes."""
+
+        with self.assertRaises(AttributeError):
+            self.quote_1.price = Decimal('1.00')
+
+        with self.assertRaises(AttributeError):
+            self.quote_1.extra = 'extra'
+
+    def test_comparison_result(self):
+        """Tests that the comparison result matches the percentage change and multiple between two quotes."""
+
+        self.assertEqual(ComparisonResult.from_quotes(self.quote_1, self.quote_2), (Decimal('100.00'), Decimal('2.00')))
+        self.assertEqual(ComparisonResult.from_quotes(self.quote_2, self.quote_1), (Decimal('-50.00'), Decimal('2.00')))
+        self.assertEqual(ComparisonResult.from_quotes(self.quote_1, self.quote_2).to_json(), {'percentage_change': 100.0, 'multiple': 2.0})
+
+    def test_parse_cmc_quote(self):
+        """Tests that a CoinMarketCap payload is parsed into a quote."""
+
+        data = {'data': {'FAKE': [{'name': 'Fake Coin', 'symbol': 'FAKE', 'tags': ['many', 'unused', 'fields'], 'quote': {'USD': {'price': 1.23456, 'market_cap': 123456789.987, 'volume_24h': 1}}}]}}
+
+        self.assertEqual(parse_cmc_quote(data, 'FAKE'), Quote('Fake Coin', 'FAKE', Decimal('1.23'), Decimal('123456789.99')))
+
+        with self.assertRaises(AssetLookupError):
+            parse_cmc_quote({'data': {}}, 'FAKE')
+
+    def test_parse_av_quote(self):
+        """Tests that Alpha Vantage payloads are parsed into a quote."""
+
+        global_quote = {'Global Quote': {'01. symbol': 'FAKE', '05. price': '10.005'}}
+        overview = {'Name': 'Fake Inc', 'MarketCapitalization': '5000000'}
+
+        self.assertEqual(parse_av_quote(global_quote, overview, 'FAKE'), Quote('Fake Inc', 'FAKE', Decimal('10.00'), Decimal('5000000.00')))
+
+        with self.assertRaises(AssetLookupError):
+            parse_av_quote({'Global Quote': {}}, overview, 'FAKE')
+
+    def test_parse_throttled_replies(self):
+        """Tests that throttled API replies raise ApiUnavailableError instead of reporting missing data."""
+
+        with self.assertRaises(ApiUnavailableError):
+            parse_av_quote({'Note': 'Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute.'}, {}, 'FAKE')
+
+        with self.assertRaises(ApiUnavailableError):
+            parse_av_quote({'Global Quote': {}}, {'Information': 'Our standard API rate limit is 25 requests per day.'}, 'FAKE')
+
+        with self.assertRaises(ApiUnavailableError):
+            parse_cmc_quote({'status': {'error_code': 1008, 'error_message': "You've exceeded your API Key's HTTP request rate limit."}}, 'FAKE')
@@ -1,7 +1,9 @@
 import os
+from datetime import date
 from unittest import TestCase
 
-from models import db, User, Asset, UserAssetComparison
+from models import db, User, Asset, UserAssetComparison, UserAssetComparisonDaily
+from retention import apply_retention, list_monthly_partitions
 from flask_bcrypt import Bcrypt
 bcrypt = Bcrypt()
 
@@ -21,6 +23,7 @@ class UserAssetComparisonModel(TestCase):
         User.query.delete()
         Asset.query.delete()
         UserAssetComparison.query.delete()
+        UserAssetComparisonDaily.query.delete()
 
         self.client = app.test_client()
 
@@ -59,4 +62,33 @@ class UserAssetComparisonModel(TestCase):
         """Tests that the asset_1 and asset_2 relationship works as expected."""
 
         self.assertEqual(self.uac.asset_1, self.testasset1)
-        self.assertEqual(self.uac.asset_2, self.testasset2)
\ No newline at end of file
+        self.assertEqual(self.uac.asset_2, self.testasset2)
+
+    def test_retention_rolls_up_expired_comparisons(self):
+        """Tests that comparisons older than the retention period are rolled up into daily aggregates and removed."""
+
+        dropped = apply_retention(retention_months=1, months_ahead=0, today=date(2018, 3, 15))
+
+        self.assertEqual(dropped, [])
+        self.assertEqual(UserAssetComparison.query.count(), 0)
+
+        daily = UserAssetComparisonDaily.query.one()
+        self.assertEqual(daily.user_id, self.testuser1.id)
+        self.assertEqual(daily.comparison_date, date(2018, 1, 1))
+        self.assertEqual(daily.comparison_count, 1)
+        self.assertEqual(float(daily.avg_percent_difference), 100.00)
+
+    def test_retention_creates_and_drops_partitions(self):
+        """Tests that the retention job moves rows into new monthly partitions and drops expired ones."""
+
+        apply_retention(retention_months=1, months_ahead=1, today=date(2018, 1, 1))
+
+        self.assertIn(date(2018, 1, 1), list_monthly_partitions())
+        self.assertIn(date(2018, 2, 1), list_monthly_partitions())
+        self.assertEqual(UserAssetComparison.query.count(), 1)
+
+        dropped = apply_retention(retention_months=1, months_ahead=0, today=date(2018, 3, 1))
+
+        self.assertEqual(dropped, ['users_assets_comparisons_p2018_01'])
+        self.assertEqual(UserAssetComparison.query.count(), 0)
+        self.assertEqual(UserAssetComparisonDaily.query.count(), 1)
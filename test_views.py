@@ -1,8 +1,14 @@
+import json
 import os
 
+from datetime import datetime, timedelta
 from unittest import TestCase
+from unittest.mock import Mock, patch
 
-from models import db, User, Asset, UserAssetComparison
+import requests
+
+import fx
+from models import db, User, Asset, UserAssetComparison, FxRate
 from flask import url_for
 from flask_bcrypt import Bcrypt
 from constants import CURRENT_USER_KEY
@@ -10,6 +16,39 @@ bcrypt = Bcrypt()
 
 os.environ['DATABASE_URL'] = "postgresql:///mcm_test_db"
 
+BTC_PRICES = {'USD': 50000, 'EUR': 25000, 'GBP': 12500, 'JPY': 5000000}
+
+def fake_cmc_get(url, headers=None, params=None):
+    """
+    Stands in for requests.get against the CoinMarketCap API.
+    Returns a Bitcoin quote in every requested currency for FX requests, and a sample crypto quote otherwise.
+    """
+
+    if 'convert' in params:
+        quote = {currency: {'price': BTC_PRICES[currency]} for currency in params['convert'].split(',')}
+        return Mock(json=Mock(return_value={'status': {'error_code': 0}, 'data': {'1': {'id': 1, 'name': 'Bitcoin', 'symbol': 'BTC', 'quote': quote}}}))
+
+    ticker = params['symbol']
+    market_cap = {'FAKE1': 1000, 'FAKE2': 2000}[ticker]
+
+    return Mock(json=Mock(return_value={'data': {ticker: [{'name': f'FakeAsset{ticker[-1]}', 'symbol': ticker, 'quote': {'USD': {'price': market_cap / 10, 'market_cap': market_cap}}}]}}))
+
+def fake_cmc_get_one_convert(url, headers=None, params=None):
+    """Stands in for requests.get on a CoinMarketCap plan limited to one convert currency per request."""
+
+    if ',' in params.get('convert', ''):
+        return Mock(json=Mock(return_value={'status': {'error_code': 400, 'error_message': 'Your plan is limited to 1 convert options'}}))
+
+    return fake_cmc_get(url, headers, params)
+
+def fake_cmc_get_fx_down(url, headers=None, params=None):
+    """Stands in for requests.get with the FX request failing."""
+
+    if 'convert' in params:
+        raise requests.exceptions.ConnectionError('FX service down')
+
+    return fake_cmc_get(url, headers, params)
+
 from app import app
 
 db.drop_all()
@@ -23,6 +62,8 @@ class ViewTestCase(TestCase):
         User.query.delete()
         Asset.query.delete()
         UserAssetComparison.query.delete()
+        FxRate.query.delete()
+        fx._fx_matrix = None
 
         self.client = app.test_client()
 
@@ -97,6 +138,149 @@ class ViewTestCase(TestCase):
             self.assertIn('FakeAsset1', html)
             self.assertIn('FakeAsset2', html)
 
+    def test_export_history_csv(self):
+        """Test export_history view with the default csv format."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/export_history')
+            lines = resp.get_data(as_text=True).splitlines()
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('text/csv', resp.content_type)
+            self.assertEqual(len(lines), 2)
+            self.assertTrue(lines[0].startswith('comparison_timestamp,name_1'))
+            self.assertIn('FakeAsset1', lines[1])
+            self.assertIn('FakeAsset2', lines[1])
+
+    def test_export_history_ndjson(self):
+        """Test export_history view with the ndjson format."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            history = c.get('/get_user_history').json['history']
+            resp = c.get('/export_history?format=ndjson')
+            lines = resp.get_data(as_text=True).splitlines()
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([json.loads(line) for line in lines], history)
+
+    def test_get_user_history_convert(self):
+        """Test get_user_history view converting market caps with cached FX rates."""
+        db.session.add_all([FxRate(currency=currency, usd_rate=rate, updated_at=datetime.now()) for currency, rate in {'USD': 1, 'EUR': 0.5, 'GBP': 0.25, 'JPY': 100, 'BTC': 0.00001}.items()])
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/get_user_history?convert=eur')
+            comparison = resp.json['history'][0]
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(comparison['currency'], 'EUR')
+            self.assertEqual(comparison['asset_1_market_cap_at_comparison'], 500.0)
+            self.assertEqual(comparison['asset_2_market_cap_at_comparison'], 1000.0)
+            self.assertEqual(comparison['percent_difference'], 100.0)
+
+    def test_get_user_history_unsupported_currency(self):
+        """Test get_user_history view with an unsupported currency."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/get_user_history?convert=XYZ')
+            self.assertEqual(resp.status_code, 400)
+
+    @patch('app.validate_csrf')
+    @patch('requests.get', side_effect=fake_cmc_get)
+    def test_handle_comparison_convert(self, get, validate_csrf):
+        """Test handle_comparison view converting results, refreshing missing FX rates with one bulk request."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.post('/handle_comparison', json={'csrf_token': 'token', 'asset_type_1': 'crypto', 'ticker_1': 'FAKE1', 'asset_type_2': 'crypto', 'ticker_2': 'FAKE2', 'convert': 'eur'})
+            results = resp.json['results']
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(results['currency'], 'EUR')
+            self.assertEqual(results['market_cap_1'], 500.0)
+            self.assertEqual(results['market_cap_2'], 1000.0)
+            self.assertEqual(results['percentage_change'], 100.0)
+            self.assertEqual(len([call for call in get.call_args_list if 'convert' in call[1]['params']]), 1)
+            self.assertEqual(FxRate.query.count(), 5)
+            self.assertEqual(UserAssetComparison.query.count(), 2)
+
+    @patch('app.validate_csrf')
+    @patch('requests.get', side_effect=fake_cmc_get_fx_down)
+    def test_handle_comparison_fx_unavailable(self, get, validate_csrf):
+        """Test handle_comparison view when FX rates cannot be retrieved."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.post('/handle_comparison', json={'csrf_token': 'token', 'asset_type_1': 'crypto', 'ticker_1': 'FAKE1', 'asset_type_2': 'crypto', 'ticker_2': 'FAKE2', 'convert': 'EUR'})
+            self.assertEqual(resp.status_code, 503)
+            self.assertEqual(UserAssetComparison.query.count(), 1)
+
+    @patch('app.validate_csrf')
+    def test_handle_comparison_invalid_currency(self, validate_csrf):
+        """Test handle_comparison view with a convert value that is not a currency code."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.post('/handle_comparison', json={'csrf_token': 'token', 'asset_type_1': 'crypto', 'ticker_1': 'FAKE1', 'asset_type_2': 'crypto', 'ticker_2': 'FAKE2', 'convert': 1})
+            self.assertEqual(resp.status_code, 400)
+
+    @patch('requests.get', side_effect=fake_cmc_get)
+    def test_get_user_history_refreshes_stale_rates(self, get):
+        """Test get_user_history view refreshing stale FX rates in place with one bulk request."""
+        stale = datetime.now() - timedelta(days=1)
+        db.session.add_all([FxRate(currency=currency, usd_rate=1, updated_at=stale) for currency in ['USD', 'EUR', 'GBP', 'JPY', 'BTC']])
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/get_user_history?convert=EUR')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['history'][0]['asset_1_market_cap_at_comparison'], 500.0)
+            self.assertEqual(get.call_count, 1)
+            self.assertEqual(float(FxRate.query.get('EUR').usd_rate), 0.5)
+
+    @patch('requests.get', side_effect=fake_cmc_get_one_convert)
+    def test_get_user_history_one_convert_plan(self, get):
+        """Test get_user_history view falling back to one FX request per currency when the plan allows one convert currency."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/get_user_history?convert=EUR')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['history'][0]['asset_1_market_cap_at_comparison'], 500.0)
+            self.assertEqual(get.call_count, 5)
+            self.assertTrue(all(call[1]['params']['id'] == 1 for call in get.call_args_list))
+
+    @patch('requests.get', side_effect=fake_cmc_get_fx_down)
+    def test_get_user_history_fx_unavailable(self, get):
+        """Test get_user_history view when FX rates cannot be retrieved."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/get_user_history?convert=EUR')
+            self.assertEqual(resp.status_code, 503)
+
+    def test_export_history_invalid_format(self):
+        """Test export_history view with an unsupported format."""
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURRENT_USER_KEY] = self.testuser1.id
+
+            resp = c.get('/export_history?format=xml')
+            self.assertEqual(resp.status_code, 400)
+
 
         
     